@@ -190,13 +190,26 @@ class Generator(object):
         return list(self.iternames(namespace=namespace, idx=idx))
 
     def namespaces(self):
-        return set(ns for n, ns in self.iternames(namespace=True))
+        # generator trees are immutable, so the walk is done once; callers get their own copy
+        try:
+            cache = self._namespacescache
+        except AttributeError:
+            cache = self._namespacescache = frozenset(ns for n, ns in self.iternames(namespace=True))
+        return set(cache)
 
     def namedschema(self):
         return self._namedschema({})
 
     def findbynames(self, schematype, namespace, **names):
-        return self._findbynames(schematype, namespace, names, set())
+        # generator trees are immutable, so the result of a search can be kept
+        try:
+            cache = self._findbynamescache
+        except AttributeError:
+            cache = self._findbynamescache = {}
+        key = (schematype, namespace) + tuple(sorted(names.items()))
+        if key not in cache:
+            cache[key] = self._findbynames(schematype, namespace, names, set())
+        return cache[key]
 
     def case(self, obj):
         return self.schema.case(obj)
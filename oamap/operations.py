@@ -29,6 +29,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import ast
+import itertools
 import math
 import numbers
 import sys
@@ -43,6 +44,14 @@ import oamap.proxy
 import oamap.util
 import oamap.compiler
 
+try:
+    from numba import prange
+except ImportError:
+    prange = range if sys.version_info[0] > 2 else xrange
+
+if sys.version_info[0] > 2:
+    basestring = str
+
 recastings      = oamap.util.OrderedDict()
 transformations = oamap.util.OrderedDict()
 actions         = oamap.util.OrderedDict()
@@ -50,64 +59,233 @@ actions         = oamap.util.OrderedDict()
 ################################################################ general utilities
 
 def _setindexes(input, output):
-    if isinstance(input, oamap.proxy.ListProxy):
-        if isinstance(output, oamap.proxy.ListProxy):
-            output._whence, output._stride, output._length = input._whence, input._stride, input._length
-        elif isinstance(output, (oamap.proxy.RecordProxy, oamap.proxy.TupleProxy)):
-            output._index = input._whence
-
-    elif isinstance(input, (oamap.proxy.RecordProxy, oamap.proxy.TupleProxy)):
-        if isinstance(output, (oamap.proxy.RecordProxy, oamap.proxy.TupleProxy)):
-            output._index = input._index
-        elif isinstance(output, oamap.proxy.ListProxy):
-            output._length = output._length - input._index
-            output._whence = input._index
+    # one dict lookup on the pair of proxy types; outputs that are not proxies (e.g. a projected primitive) are left alone
+    if not isinstance(input, oamap.proxy.Proxy):
+        raise AssertionError(type(input))
+    copy = _setindexes.copiers.get((type(input), type(output)))
+    if copy is not None:
+        copy(input, output)
+    return output
 
+def _setindexes_listlist(input, output):
+    output._whence, output._stride, output._length = input._whence, input._stride, input._length
+
+def _setindexes_listindex(input, output):
+    output._index = input._whence
+
+def _setindexes_indexlist(input, output):
+    output._length = output._length - input._index
+    output._whence = input._index
+
+def _setindexes_indexindex(input, output):
+    output._index = input._index
+
+_L, _R, _T = oamap.proxy.ListProxy, oamap.proxy.RecordProxy, oamap.proxy.TupleProxy
+_setindexes.copiers = {(_L, _L): _setindexes_listlist,
+                       (_L, _R): _setindexes_listindex,
+                       (_L, _T): _setindexes_listindex,
+                       (_R, _L): _setindexes_indexlist,
+                       (_T, _L): _setindexes_indexlist,
+                       (_R, _R): _setindexes_indexindex,
+                       (_R, _T): _setindexes_indexindex,
+                       (_T, _R): _setindexes_indexindex,
+                       (_T, _T): _setindexes_indexindex}
+del _L, _R, _T
+del _setindexes_listlist, _setindexes_listindex, _setindexes_indexlist, _setindexes_indexindex
+
+def _recastcache(data, key, schema=None):
+    # a recasting depends only on the input's generator and the operation's arguments, so the generator it produces
+    # is kept on the input's generator; repeating it skips namedschema, the schema walk, and generator construction
+    try:
+        cache = data._generator._recastcache
+    except AttributeError:
+        cache = data._generator._recastcache = {}
+    if schema is not None:
+        cache[key] = schema.generator()
+    return cache.get(key)
+
+def _recastproxy(data, generator):
+    if isinstance(generator, oamap.generator.ListGenerator) and isinstance(data, oamap.proxy.ListProxy):
+        return generator(data._arrays, numentries=len(data))
     else:
-        raise AssertionError(type(input))
+        return generator(data._arrays)
 
-    return output
+def _primitiveview(view, listgenerator, data):
+    # a list of non-nullable primitives can be iterated as its underlying array, skipping ListProxy.__getitem__ per item
+    content = listgenerator.content
+    if isinstance(content, oamap.generator.PrimitiveGenerator) and not isinstance(content, oamap.generator.Masked):
+        return content._getdata(data._arrays, data._cache)[view._whence:view._whence + view._length]
+    else:
+        return view
+
+def _viewproxy(data, key, viewschema, viewarrays):
+    # the view's generator is reused by every call on the same data, so that the Numba types derived from it (which are
+    # named by generator id) are the same from call to call and, with cache=True, their compiled functions are found again
+    generator = _recastcache(data, key)
+    if generator is None:
+        generator = _recastcache(data, key, viewschema)
+    return generator(viewarrays)
+
+def _compilecache(fcn, numba, cache):
+    # with cache=True, compiled user functions and generated fill functions are kept (for the maxsize most recently used
+    # functions), so repeated operations with the same function skip exec and Numba compilation; Numba freezes the
+    # globals, closure variables, and arrays a function reads, so later changes to them are not seen (the default,
+    # cache=False, compiles on every call)
+    if not cache or not isinstance(fcn, (basestring, types.FunctionType)):
+        return {}
+    if isinstance(numba, dict):
+        numba = tuple(sorted(numba.items()))
+    key = (fcn, numba)
+    try:
+        hash(key)
+    except TypeError:
+        return {}
+
+    entries = _compilecache.entries
+    if key in entries:
+        out = entries[key]
+        del entries[key]
+    else:
+        out = {}
+    entries[key] = out
+    while len(entries) > _compilecache.maxsize:
+        del entries[next(iter(entries.keys()))]
+    return out
+
+_compilecache.entries = oamap.util.OrderedDict()
+_compilecache.maxsize = 100
+
+def _kernel(owner, name, parallel=False):
+    kernel = getattr(owner, name)
+    if isinstance(kernel, types.FunctionType):
+        try:
+            import numba as nb
+        except ImportError:
+            pass
+        else:
+            kernel = nb.jit(nopython=True, nogil=True, parallel=parallel)(kernel)
+            setattr(owner, name, kernel)
+    return kernel
     
+def _iscontiguous(starts, stops):
+    if len(starts) <= 1:
+        return True
+    # O(1) when stops is the same offsets array as starts, shifted by one (as in List offsets[:-1], offsets[1:])
+    if starts.dtype == stops.dtype and starts.strides == stops.strides and stops.__array_interface__["data"][0] == starts.__array_interface__["data"][0] + starts.strides[0]:
+        return True
+    scan = _kernel(_iscontiguous, "scan")
+    if isinstance(scan, types.FunctionType):
+        return numpy.array_equal(starts[1:], stops[:-1])      # without Numba, a Python loop would be slower
+    else:
+        return scan(starts, stops)
+
+def _iscontiguous_scan(starts, stops):
+    for i in range(len(starts) - 1):
+        if starts[i + 1] != stops[i]:
+            return False
+    return True
+
+_iscontiguous.scan = _iscontiguous_scan
+del _iscontiguous_scan
+
+def _viewoffsets(starts, stops):
+    # [min(starts), max(stops)] in one pass over both arrays
+    out = numpy.empty(2, dtype=oamap.generator.ListGenerator.posdtype)
+    fill = _kernel(_viewoffsets, "fill")
+    if isinstance(fill, types.FunctionType):
+        # without Numba, a Python loop would be slower than two numpy passes
+        if len(starts) == 0:
+            out[:] = 0
+        else:
+            out[0] = starts.min()
+            out[1] = stops.max()
+    else:
+        fill(starts, stops, out)
+    return out
+
+def _viewoffsets_fill(starts, stops, out):
+    if len(starts) == 0:
+        out[0] = 0
+        out[1] = 0
+        return
+    low = starts[0]
+    high = stops[0]
+    for i in range(1, len(starts)):
+        if starts[i] < low:
+            low = starts[i]
+        if stops[i] > high:
+            high = stops[i]
+    out[0] = low
+    out[1] = high
+
+_viewoffsets.fill = _viewoffsets_fill
+del _viewoffsets_fill
+
+def _dualsource(data):
+    # an operation applied to the output of another operation branches its _DualSource instead of nesting inside it,
+    # so array lookups don't walk one more layer for every step in a pipeline
+    if isinstance(data._arrays, _DualSource):
+        return data._arrays.branch(data._generator.namespaces())
+    else:
+        return _DualSource(data._arrays, data._generator.namespaces())
+
 class _DualSource(object):
     def __init__(self, old, oldns):
         self.old = old
         self.new = {}
 
+        if not isinstance(oldns, (set, frozenset)):
+            oldns = set(oldns)
         i = 0
-        self.namespace = None
-        while self.namespace is None or self.namespace in oldns:
-            self.namespace = "namespace-" + str(i)
+        self.namespace = "namespace-0"
+        while self.namespace in oldns:
             i += 1
+            self.namespace = "namespace-" + str(i)
 
+        self._newnamespaces = set([self.namespace])
+        self._arraynamespaces = {}
         self._arraynum = 0
 
+    def branch(self, oldns):
+        # shares the same old source and (by reference) the arrays already put here; new puts go to a fresh namespace
+        # and the copied dict, so neither this _DualSource nor proxies built on it see them
+        out = _DualSource(self.old, oldns.union(self._newnamespaces))
+        out.new = dict(self.new)
+        out._newnamespaces.update(self._newnamespaces)
+        out._arraynamespaces = dict(self._arraynamespaces)
+        out._arraynum = self._arraynum
+        return out
+
     def arrayname(self):
-        trial = None
-        while trial is None or trial in self.new:
-            trial = "array-" + str(self._arraynum)
-            self._arraynum += 1
-        return trial
+        # self.new only holds names made here (or inherited by branch along with the counter), so they never collide
+        out = "array-" + str(self._arraynum)
+        self._arraynum += 1
+        return out
 
     def getall(self, roles):
         out = {}
 
         if hasattr(self.old, "getall"):
-            out.update(self.old.getall([x for x in roles if x.namespace != self.namespace]))
+            out.update(self.old.getall([x for x in roles if x.namespace not in self._newnamespaces]))
         else:
             for x in roles:
-                if x.namespace != self.namespace:
+                if x.namespace not in self._newnamespaces:
                     out[x] = self.old[str(x)]
 
         if hasattr(self.new, "getall"):
-            out.update(self.new.getall([x for x in roles if x.namespace == self.namespace]))
+            out.update(self.new.getall([x for x in roles if x.namespace in self._newnamespaces]))
         else:
             for x in roles:
-                if x.namespace == self.namespace:
+                if x.namespace in self._newnamespaces:
                     out[x] = self.new[str(x)]
 
         return out
 
     def put(self, schemanode, *arrays):
+        # every role gets its own dense, single-dtype array (structure of arrays), so the gathers in filter, define, etc.
+        # never pull unrelated columns through the cache; this is a no-op for arrays that are already contiguous
+        arrays = tuple(numpy.ascontiguousarray(x) for x in arrays)
+
         if isinstance(schemanode, oamap.schema.Primitive):
             datarole = oamap.generator.DataRole(self.arrayname(), self.namespace)
             roles2arrays = {datarole: arrays[0]}
@@ -154,6 +332,8 @@ class _DualSource(object):
         self.putall(roles2arrays)
 
     def putall(self, roles2arrays):
+        for n in roles2arrays:
+            self._arraynamespaces[str(n)] = n.namespace
         if hasattr(self.new, "putall"):
             self.new.putall(roles2arrays)
         else:
@@ -184,7 +364,7 @@ class _DualSource(object):
             if isinstance(node, _DualSource):
                 getarrays(node.old)
                 for n, x in node.new.items():
-                    newarrays[node.namespace, n] = x
+                    newarrays[node._arraynamespaces.get(n, node.namespace), n] = x
         getarrays(arrays)
 
         oldnames = {}
@@ -317,23 +497,22 @@ class _DualSource(object):
 
 def fieldname(data, newname, at):
     if isinstance(data, oamap.proxy.Proxy):
+        key = ("fieldname", newname, at)
+        generator = _recastcache(data, key)
+        if generator is not None:
+            return _setindexes(data, _recastproxy(data, generator))
+
         schema = data._generator.namedschema()
         nodes = schema.path(at, parents=True)
         if len(nodes) < 2:
             raise TypeError("path {0} did not match a field in a record".format(repr(at)))
 
-        for n, x in nodes[1].fields.items():
-            if x is nodes[0]:
-                oldname = n
-                break
+        oldname = nodes[1]._fieldname(nodes[0])
 
         del nodes[1][oldname]
         nodes[1][newname] = nodes[0]
 
-        if isinstance(schema, oamap.schema.List):
-            return _setindexes(data, schema(data._arrays, numentries=len(data)))
-        else:
-            return _setindexes(data, schema(data._arrays))
+        return _setindexes(data, _recastproxy(data, _recastcache(data, key, schema)))
         
     else:
         raise TypeError("fieldname can only be applied to an OAMap proxy (List, Record, Tuple)")
@@ -342,6 +521,11 @@ recastings["fieldname"] = fieldname
 
 def recordname(data, newname, at=""):
     if isinstance(data, oamap.proxy.Proxy):
+        key = ("recordname", newname, at)
+        generator = _recastcache(data, key)
+        if generator is not None:
+            return _setindexes(data, _recastproxy(data, generator))
+
         schema = data._generator.namedschema()
         nodes = schema.path(at, parents=True)
         while isinstance(nodes[0], oamap.schema.List):
@@ -350,10 +534,7 @@ def recordname(data, newname, at=""):
             raise TypeError("path {0} did not match a record".format(repr(at)))
 
         nodes[0].name = newname
-        if isinstance(schema, oamap.schema.List):
-            return _setindexes(data, schema(data._arrays, numentries=len(data)))
-        else:
-            return _setindexes(data, schema(data._arrays))
+        return _setindexes(data, _recastproxy(data, _recastcache(data, key, schema)))
         
     else:
         raise TypeError("fieldname can only be applied to an OAMap proxy (List, Record, Tuple)")
@@ -364,13 +545,15 @@ recastings["recordname"] = recordname
 
 def project(data, at):
     if isinstance(data, oamap.proxy.Proxy):
+        key = ("project", at)
+        generator = _recastcache(data, key)
+        if generator is not None:
+            return _setindexes(data, _recastproxy(data, generator))
+
         schema = data._generator.namedschema().project(at)
         if schema is None:
             raise TypeError("projection resulted in no schema")
-        if isinstance(schema, oamap.schema.List) and isinstance(data, oamap.proxy.ListProxy):
-            return _setindexes(data, schema(data._arrays, numentries=len(data)))
-        else:
-            return _setindexes(data, schema(data._arrays))
+        return _setindexes(data, _recastproxy(data, _recastcache(data, key, schema)))
     else:
         raise TypeError("project can only be applied to an OAMap proxy (List, Record, Tuple)")
 
@@ -378,13 +561,15 @@ recastings["project"] = project
 
 def keep(data, *paths):
     if isinstance(data, oamap.proxy.Proxy):
+        key = ("keep",) + paths
+        generator = _recastcache(data, key)
+        if generator is not None:
+            return _setindexes(data, _recastproxy(data, generator))
+
         schema = data._generator.namedschema().keep(*paths)
         if schema is None:
             raise TypeError("keep operation resulted in no schema")
-        if isinstance(schema, oamap.schema.List):
-            return _setindexes(data, schema(data._arrays, numentries=len(data)))
-        else:
-            return _setindexes(data, schema(data._arrays))
+        return _setindexes(data, _recastproxy(data, _recastcache(data, key, schema)))
     else:
         raise TypeError("keep can only be applied to an OAMap proxy (List, Record, Tuple)")
 
@@ -392,13 +577,15 @@ recastings["keep"] = keep
 
 def drop(data, *paths):
     if isinstance(data, oamap.proxy.Proxy):
+        key = ("drop",) + paths
+        generator = _recastcache(data, key)
+        if generator is not None:
+            return _setindexes(data, _recastproxy(data, generator))
+
         schema = data._generator.namedschema().drop(*paths)
         if schema is None:
             raise TypeError("drop operation resulted in no schema")
-        if isinstance(schema, oamap.schema.List):
-            return _setindexes(data, schema(data._arrays, numentries=len(data)))
-        else:
-            return _setindexes(data, schema(data._arrays))
+        return _setindexes(data, _recastproxy(data, _recastcache(data, key, schema)))
     else:
         raise TypeError("drop can only be applied to an OAMap proxy (List, Record, Tuple)")
 
@@ -408,6 +595,11 @@ recastings["drop"] = drop
 
 def split(data, *paths):
     if isinstance(data, oamap.proxy.Proxy):
+        key = ("split",) + paths
+        generator = _recastcache(data, key)
+        if generator is not None:
+            return _recastproxy(data, generator)
+
         schema = data._generator.namedschema()
         newschema = []
 
@@ -434,15 +626,8 @@ def split(data, *paths):
             else:
                 datanode, innernode, listnode, outernode = nodes[0], nodes[1], nodes[2], nodes[3]
 
-            for n, x in innernode.fields.items():
-                if x is datanode:
-                    innername = n
-                    break
-            outername = None
-            for n, x in outernode.fields.items():
-                if x is listnode:
-                    outername = n
-                    break
+            innername = innernode._fieldname(datanode)
+            outername = outernode._fieldname(listnode)
 
             del innernode[innername]
             if len(innernode.fields) == 0 and outername is not None:
@@ -460,10 +645,7 @@ def split(data, *paths):
                 for n, x in ns.fields.items():
                     schema[n] = x
 
-        if isinstance(schema, oamap.schema.List):
-            return schema(data._arrays, numentries=len(data))
-        else:
-            return schema(data._arrays)
+        return _recastproxy(data, _recastcache(data, key, schema))
 
     else:
         raise TypeError("split can only be applied to an OAMap proxy (List, Record, Tuple)")
@@ -474,6 +656,11 @@ recastings["split"] = split
 
 def merge(data, container, *paths):
     if isinstance(data, oamap.proxy.Proxy):
+        key = ("merge", container) + paths
+        generator = _recastcache(data, key)
+        if generator is not None:
+            return _recastproxy(data, generator)
+
         schema = data._generator.namedschema()
 
         allpaths = []
@@ -528,10 +715,7 @@ def merge(data, container, *paths):
             listnode, outernode = nodes[0], nodes[1]
             listnodes.append(listnode)
 
-            for n, x in outernode.fields.items():
-                if x is listnode:
-                    outername = n
-                    break
+            outername = outernode._fieldname(listnode)
 
             del outernode[outername]
             containerrecord[outername] = listnode.content
@@ -557,10 +741,7 @@ def merge(data, container, *paths):
             containerlist.starts = listnodes[0].starts
             containerlist.stops = listnodes[0].stops
 
-        if isinstance(schema, oamap.schema.List):
-            return schema(data._arrays, numentries=len(data))
-        else:
-            return schema(data._arrays)
+        return _recastproxy(data, _recastcache(data, key, schema))
 
     else:
         raise TypeError("merge can only be applied to an OAMap proxy (List, Record, Tuple)")
@@ -603,12 +784,13 @@ def parent(data, fieldname, at):
             else:
                 parent.fill = nb.jit(nopython=True, nogil=True)(parent.fill)
 
-        pointers = numpy.empty(stops.max() - starts.min(), dtype=oamap.generator.PointerGenerator.posdtype)
+        low, high = _viewoffsets(starts, stops)
+        pointers = numpy.empty(high - low, dtype=oamap.generator.PointerGenerator.posdtype)
         parent.fill(starts, stops, pointers)
 
         childnode[fieldname] = oamap.schema.Pointer(parentnode)
 
-        arrays = _DualSource(data._arrays, data._generator.namespaces())
+        arrays = _dualsource(data)
         arrays.put(childnode[fieldname], pointers)
 
         if isinstance(schema, oamap.schema.List):
@@ -656,12 +838,13 @@ def index(data, fieldname, at):
             else:
                 index.fill = nb.jit(nopython=True, nogil=True)(index.fill)
 
-        values = numpy.empty(stops.max() - starts.min(), dtype=numpy.int32)   # int32
+        low, high = _viewoffsets(starts, stops)
+        values = numpy.empty(high - low, dtype=numpy.int32)   # int32
         index.fill(starts, stops, values)
 
         childnode[fieldname] = oamap.schema.Primitive(values.dtype)
 
-        arrays = _DualSource(data._arrays, data._generator.namespaces())
+        arrays = _dualsource(data)
         arrays.put(childnode[fieldname], values)
 
         if isinstance(schema, oamap.schema.List):
@@ -690,33 +873,37 @@ def tomask(data, at, low, high=None):
             nodes = (nodes[0].content,) + nodes
         node = nodes[0]
 
-        arrays = _DualSource(data._arrays, data._generator.namespaces())
+        arrays = _dualsource(data)
 
         if isinstance(node, oamap.schema.Primitive):
             generator = data._generator.findbynames("Primitive", node.namespace, data=node.data, mask=node.mask)
 
-            primitive = generator._getdata(data._arrays, data._cache).copy()
+            # the kernels only read primitive and oldmask, so the new arrays can share the old primitive; the mask is written out-of-place
+            primitive = generator._getdata(data._arrays, data._cache)
             if node.nullable:
-                mask = generator._getmask(data._arrays, data._cache).copy()
+                oldmask = generator._getmask(data._arrays, data._cache)
+                mask = numpy.empty(len(oldmask), dtype=oamap.generator.Masked.maskdtype)
+                identity = False
             else:
                 node.nullable = True
-                mask = numpy.arange(len(primitive), dtype=oamap.generator.Masked.maskdtype)
-
-            if high is None:
-                if math.isnan(low):
-                    selection = numpy.isnan(primitive)
-                else:
-                    selection = (primitive == low)
+                mask = oldmask = numpy.empty(len(primitive), dtype=oamap.generator.Masked.maskdtype)
+                identity = True
+
+            # the comparison is chosen once here, so that each kernel's loop has a single test per entry
+            if high is None and math.isnan(low):
+                name, params = "isnan", ()
+            elif high is None:
+                name, params = "equal", (low,)
             else:
                 if math.isnan(low) or math.isnan(high):
                     raise ValueError("if a range is specified, neither of the endpoints can be NaN")
-                selected_nans = numpy.isnan(primitive)
-                primitive[selected_nans] = low
-                selection = (primitive >= low)
-                numpy.bitwise_and(selection, (primitive <= high), selection)
-                selection[selected_nans] = False
+                name, params = "inrange", (low, high)
 
-            mask[selection] = oamap.generator.Masked.maskedvalue
+            kernel = _kernel(tomask, name, parallel=True)
+            if isinstance(kernel, types.FunctionType):
+                tomask.vectorized(primitive, oldmask, mask, identity, name, params)   # without Numba, a Python loop would be slower
+            else:
+                kernel(*((primitive, oldmask, mask, identity) + params))
 
             arrays.put(node, primitive, mask)
 
@@ -731,6 +918,64 @@ def tomask(data, at, low, high=None):
     else:
         raise TypeError("tomask can only be applied to an OAMap proxy (List, Record, Tuple)")
 
+# each kernel makes a single pass, reading oldmask and writing mask; NaN fails every comparison, so it is never in a range
+# and never equal, and is only matched by isnan (x != x is the NaN test, valid for any dtype)
+# if identity, there is no oldmask and entry i is filled with i (or _maskedvalue) without first writing numpy.arange
+# both sides of j are cast to int64 because a parallel prange index is unsigned, and unifying it with oldmask's signed
+# dtype would otherwise make j a float
+# _maskedvalue is a module-level global, which Numba freezes into the kernels as a compile-time constant
+_maskedvalue = oamap.generator.Masked.maskedvalue
+
+def _tomask_isnan(primitive, oldmask, mask, identity):
+    for i in prange(len(mask)):
+        j = numpy.int64(i) if identity else numpy.int64(oldmask[i])
+        if j != _maskedvalue and primitive[j] != primitive[j]:
+            mask[i] = _maskedvalue
+        else:
+            mask[i] = j
+
+def _tomask_equal(primitive, oldmask, mask, identity, low):
+    for i in prange(len(mask)):
+        j = numpy.int64(i) if identity else numpy.int64(oldmask[i])
+        if j != _maskedvalue and primitive[j] == low:
+            mask[i] = _maskedvalue
+        else:
+            mask[i] = j
+
+def _tomask_inrange(primitive, oldmask, mask, identity, low, high):
+    for i in prange(len(mask)):
+        j = numpy.int64(i) if identity else numpy.int64(oldmask[i])
+        if j != _maskedvalue and low <= primitive[j] <= high:
+            mask[i] = _maskedvalue
+        else:
+            mask[i] = j
+
+# the same selections as whole-array numpy operations, for when Numba is not available
+def _tomask_vectorized(primitive, oldmask, mask, identity, name, params):
+    if identity:
+        mask[:] = numpy.arange(len(mask))
+    else:
+        mask[:] = oldmask
+    selected = numpy.flatnonzero(mask != _maskedvalue)
+    values = primitive[mask[selected]]
+    with numpy.errstate(invalid="ignore"):   # NaN is never in a range, without a warning
+        if name == "isnan":
+            hit = values != values
+        elif name == "equal":
+            hit = values == params[0]
+        else:
+            hit = (params[0] <= values) & (values <= params[1])
+    mask[selected[hit]] = _maskedvalue
+
+tomask.vectorized = _tomask_vectorized
+tomask.isnan = _tomask_isnan
+tomask.equal = _tomask_equal
+tomask.inrange = _tomask_inrange
+del _tomask_vectorized
+del _tomask_isnan
+del _tomask_equal
+del _tomask_inrange
+
 transformations["tomask"] = tomask
 
 ################################################################ flatten
@@ -754,15 +999,21 @@ def flatten(data, at=""):
         innergenerator = data._generator.findbynames("List", innernode.namespace, starts=innernode.starts, stops=innernode.stops)
         innerstarts, innerstops = innergenerator._getstartsstops(data._arrays, data._cache)
 
-        if not numpy.array_equal(innerstarts[1:], innerstops[:-1]):
+        if not _iscontiguous(innerstarts, innerstops):
             raise NotImplementedError("inner arrays are not contiguous: flatten would require the creation of pointers")
 
-        starts = innerstarts[outerstarts]
-        stops  = innerstops[outerstops - 1]
+        gather = _kernel(flatten, "gather", parallel=True)
+        if isinstance(gather, types.FunctionType):
+            starts = innerstarts[outerstarts]                # without Numba, a Python loop would be slower than the copies
+            stops  = innerstops[outerstops - 1]
+        else:
+            starts = numpy.empty(len(outerstarts), dtype=innerstarts.dtype)
+            stops  = numpy.empty(len(outerstops), dtype=innerstops.dtype)
+            gather(innerstarts, innerstops, outerstarts, outerstops, starts, stops)
 
         outernode.content = innernode.content
 
-        arrays = _DualSource(data._arrays, data._generator.namespaces())
+        arrays = _dualsource(data)
         arrays.put(outernode, starts, stops)
         if isinstance(schema, oamap.schema.List) and outernode is not schema:
             return schema(arrays, numentries=len(data))
@@ -772,11 +1023,20 @@ def flatten(data, at=""):
     else:
         raise TypeError("flatten can only be applied to a top-level OAMap proxy (List, Record, Tuple)")
 
+# one pass fills both starts and stops, without the outerstops - 1 temporary
+def _flatten_gather(innerstarts, innerstops, outerstarts, outerstops, starts, stops):
+    for i in prange(len(outerstarts)):
+        starts[i] = innerstarts[outerstarts[i]]
+        stops[i] = innerstops[outerstops[i] - 1]
+
+flatten.gather = _flatten_gather
+del _flatten_gather
+
 transformations["flatten"] = flatten
 
 ################################################################ filter
 
-def filter(data, fcn, args=(), at="", numba=True):
+def filter(data, fcn, args=(), at="", numba=True, cache=False):
     if not isinstance(args, tuple):
         try:
             args = tuple(args)
@@ -806,68 +1066,115 @@ def filter(data, fcn, args=(), at="", numba=True):
             else:
                 viewstarts, viewstops = listgenerator._getstartsstops(data._arrays, data._cache)
             viewschema = listgenerator.namedschema()
-            viewarrays = _DualSource(data._arrays, data._generator.namespaces())
-            viewoffsets = numpy.array([viewstarts.min(), viewstops.max()], dtype=oamap.generator.ListGenerator.posdtype)
+            viewarrays = _dualsource(data)
+            viewoffsets = _viewoffsets(viewstarts, viewstops)
             viewarrays.put(viewschema, viewoffsets[:1], viewoffsets[-1:])
-            view = viewschema(viewarrays)
-
-        fcn = oamap.util.stringfcn(fcn)
-        params = fcn.__code__.co_varnames[:fcn.__code__.co_argcount]
-        avoid = set(params)
-        fcnname = oamap.util.varname(avoid, "fcn")
-        fillname = oamap.util.varname(avoid, "fill")
-        lenname = oamap.util.varname(avoid, "len")
-        rangename = oamap.util.varname(avoid, "range")
+            view = _viewproxy(data, ("view", listgenerator.id), viewschema, viewarrays)
 
         ptypes = oamap.util.paramtypes(args)
         if ptypes is not None:
             import numba as nb
             from oamap.compiler import typeof_generator
             ptypes = (typeof_generator(view._generator.content),) + ptypes
-        fcn = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba)
-        rtype = oamap.util.returntype(fcn, ptypes)
-        if rtype is not None:
-            if rtype != nb.types.boolean:
-                raise TypeError("filter function must return boolean, not {0}".format(rtype))
 
-        if all(isinstance(x, (oamap.schema.Record, oamap.schema.Tuple)) for x in nodes[1:]):
-            env = {fcnname: fcn}
-            oamap.util.doexec("""
-def {fill}({view}, {pointers}{params}):
-    {i} = 0
-    {numitems} = 0
-    for {datum} in {view}:
-        if {fcn}({datum}{params}):
-            {pointers}[{numitems}] = {i}
-            {numitems} += 1
-        {i} += 1
-    return {numitems}
+        view = _primitiveview(view, listgenerator, data)
+        flat = all(isinstance(x, (oamap.schema.Record, oamap.schema.Tuple)) for x in nodes[1:])
+        ufunc = isinstance(fcn, numpy.ufunc) and isinstance(view, numpy.ndarray)
+
+        if not ufunc:
+            cache = _compilecache(fcn, numba, cache)
+            if ("fcn", ptypes) not in cache:
+                fcn = oamap.util.stringfcn(fcn)
+                code = fcn.__code__
+                cache["fcn", ptypes] = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba), code.co_varnames[:code.co_argcount]
+            fcn, params = cache["fcn", ptypes]
+            rtype = oamap.util.returntype(fcn, ptypes)
+
+            avoid = set(params)
+            fcnname = oamap.util.varname(avoid, "fcn")
+            fillname = oamap.util.varname(avoid, "fill")
+            lenname = oamap.util.varname(avoid, "len")
+            rangename = oamap.util.varname(avoid, "range")
+            prangename = oamap.util.varname(avoid, "prange")
+
+            if rtype is not None:
+                if rtype != nb.types.boolean:
+                    raise TypeError("filter function must return boolean, not {0}".format(rtype))
+
+        if flat:
+            if ufunc:
+                # a numpy predicate on a flat list of primitives makes all the flags at once, without a generated loop
+                flags = fcn(*((view,) + args))
+                if not isinstance(flags, numpy.ndarray) or flags.dtype != numpy.dtype(numpy.bool_):
+                    raise TypeError("filter function must return boolean, not {0}".format(getattr(flags, "dtype", type(flags))))
+            else:
+                if ("filter", ptypes) not in cache:
+                    env = {fcnname: fcn, lenname: len, prangename: oamap.util.tryprange(numba)}
+                    oamap.util.doexec("""
+def {fill}({view}, {flags}{params}):
+    for {i} in {prange}({len}({view})):
+        {flags}[{i}] = {fcn}({view}[{i}]{params})
 """.format(fill=fillname,
            view=oamap.util.varname(avoid, "view"),
-           pointers=oamap.util.varname(avoid, "pointers"),
+           flags=oamap.util.varname(avoid, "flags"),
            params="".join("," + x for x in params[1:]),
            i=oamap.util.varname(avoid, "i"),
-           numitems=oamap.util.varname(avoid, "numitems"),
-           datum=oamap.util.varname(avoid, "datum"),
+           prange=prangename,
+           len=lenname,
            fcn=fcnname), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
-
-            pointers = numpy.empty(len(view), dtype=oamap.generator.PointerGenerator.posdtype)
-            numitems = fill(*((view, pointers) + args))
-            pointers = pointers[:numitems]
+                    cache["filter", ptypes] = oamap.util.trycompile(env[fillname], numba=numba, parallel=True)
+                fill = cache["filter", ptypes]
+                flags = numpy.empty(len(view), dtype=numpy.bool_)
+                fill(*((view, flags) + args))
+
+            if ufunc:
+                # fully vectorized: no compiled code at all
+                pointers = numpy.flatnonzero(flags).astype(oamap.generator.PointerGenerator.posdtype)
+                numitems = len(pointers)
+            else:
+                numitems = numpy.count_nonzero(flags)
+                pointers = numpy.empty(numitems + 1, dtype=oamap.generator.PointerGenerator.posdtype)
+                bounds = numpy.array([0, len(view)], dtype=oamap.generator.ListGenerator.posdtype)
+                _kernel(filter, "scatter")(bounds[:1], bounds[-1:], flags, pointers)
+                pointers = pointers[:numitems]
             offsets = numpy.array([0, numitems], dtype=oamap.generator.ListGenerator.posdtype)
 
+        elif ufunc:
+            # a numpy predicate on nested lists of primitives: flags in the view's order, counts from a running sum
+            flags = fcn(*((view,) + args))
+            if not isinstance(flags, numpy.ndarray) or flags.dtype != numpy.dtype(numpy.bool_):
+                raise TypeError("filter function must return boolean, not {0}".format(getattr(flags, "dtype", type(flags))))
+            running = numpy.empty(len(view) + 1, dtype=oamap.generator.ListGenerator.posdtype)
+            running[0] = 0
+            numpy.cumsum(flags, out=running[1:])
+
+            offsets = numpy.empty(len(viewstarts) + 1, dtype=oamap.generator.ListGenerator.posdtype)
+            offsets[0] = 0
+            numpy.cumsum(running[viewstops] - running[viewstarts], out=offsets[1:])
+            numitems = offsets[-1]
+
+            if len(viewstarts) == 0:
+                pointers = numpy.empty(0, dtype=oamap.generator.PointerGenerator.posdtype)
+            elif _iscontiguous(viewstarts, viewstops):
+                pointers = numpy.flatnonzero(flags[viewstarts[0]:viewstops[-1]]).astype(oamap.generator.PointerGenerator.posdtype)
+                pointers += viewstarts[0]
+            else:
+                pointers = numpy.empty(numitems + 1, dtype=oamap.generator.PointerGenerator.posdtype)
+                _kernel(filter, "select")(viewstarts, viewstops, flags, pointers)
+                pointers = pointers[:numitems]
+
         else:
-            env = {fcnname: fcn, lenname: len, rangename: range if sys.version_info[0] > 2 else xrange}
-            oamap.util.doexec("""
-def {fill}({view}, {viewstarts}, {viewstops}, {stops}, {pointers}{params}):
+            if ("filter-nested", ptypes) not in cache:
+                env = {fcnname: fcn, lenname: len, rangename: range if sys.version_info[0] > 2 else xrange}
+                oamap.util.doexec("""
+def {fill}({view}, {viewstarts}, {viewstops}, {stops}, {flags}{params}):
+    {k} = 0
     {numitems} = 0
     for {i} in {range}({len}({viewstarts})):
         for {j} in {range}({viewstarts}[{i}], {viewstops}[{i}]):
-            {datum} = {view}[{j}]
-            if {fcn}({datum}{params}):
-                {pointers}[{numitems}] = {j}
-                {numitems} += 1
+            {flags}[{k}] = {fcn}({view}[{j}]{params})
+            {numitems} += {flags}[{k}]
+            {k} += 1
         {stops}[{i}] = {numitems}
     return {numitems}
 """.format(fill=fillname,
@@ -875,21 +1182,24 @@ def {fill}({view}, {viewstarts}, {viewstops}, {stops}, {pointers}{params}):
            viewstarts=oamap.util.varname(avoid, "viewstarts"),
            viewstops=oamap.util.varname(avoid, "viewstops"),
            stops=oamap.util.varname(avoid, "stops"),
-           pointers=oamap.util.varname(avoid, "pointers"),
+           flags=oamap.util.varname(avoid, "flags"),
            params="".join("," + x for x in params[1:]),
+           k=oamap.util.varname(avoid, "k"),
            numitems=oamap.util.varname(avoid, "numitems"),
            i=oamap.util.varname(avoid, "i"),
            range=rangename,
            len=lenname,
            j=oamap.util.varname(avoid, "j"),
-           datum=oamap.util.varname(avoid, "datum"),
            fcn=fcnname), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
+                cache["filter-nested", ptypes] = oamap.util.trycompile(env[fillname], numba=numba)
+            fill = cache["filter-nested", ptypes]
 
             offsets = numpy.empty(len(viewstarts) + 1, dtype=oamap.generator.ListGenerator.posdtype)
             offsets[0] = 0
-            pointers = numpy.empty(len(view), dtype=oamap.generator.PointerGenerator.posdtype)
-            numitems = fill(*((view, viewstarts, viewstops, offsets[1:], pointers) + args))
+            flags = numpy.empty(len(view), dtype=numpy.bool_)
+            numitems = fill(*((view, viewstarts, viewstops, offsets[1:], flags) + args))
+            pointers = numpy.empty(numitems + 1, dtype=oamap.generator.PointerGenerator.posdtype)
+            _kernel(filter, "scatter")(viewstarts, viewstops, flags, pointers)
             pointers = pointers[:numitems]
 
         listnode.content = oamap.schema.Pointer(listnode.content)
@@ -898,10 +1208,14 @@ def {fill}({view}, {viewstarts}, {viewstops}, {stops}, {pointers}{params}):
             if isinstance(listgenerator.content, oamap.generator.Masked):
                 raise NotImplementedError("nullable; need to merge masks")
             innerpointers = listgenerator.content._getpositions(data._arrays, data._cache)
-            pointers = innerpointers[pointers]
+            chain = _kernel(filter, "chain")
+            if isinstance(chain, types.FunctionType):
+                pointers = innerpointers[pointers]           # without Numba, a Python loop would be slower than the copy
+            else:
+                chain(innerpointers, pointers)               # pointers belongs to this filter, so it can be overwritten
             listnode.content.target = listnode.content.target.target
 
-        arrays = _DualSource(data._arrays, data._generator.namespaces())
+        arrays = _dualsource(data)
         arrays.put(listnode, offsets[:-1], offsets[1:])
         arrays.put(listnode.content, pointers)
         if isinstance(schema, oamap.schema.List) and listnode is schema:
@@ -914,11 +1228,48 @@ def {fill}({view}, {viewstarts}, {viewstops}, {stops}, {pointers}{params}):
     else:
         raise TypeError("filter can only be applied to a top-level OAMap proxy (List, Record, Tuple)")
 
+# second pass of filter: the first pass only writes one flag per item (in iteration order) and counts them,
+# so pointers can be allocated at numitems instead of len(view); both passes are branchless, always storing and
+# advancing by the flag, so pointers has one extra slot for the store after the last kept item
+def _filter_scatter(viewstarts, viewstops, flags, pointers):
+    k = 0
+    numitems = 0
+    for i in range(len(viewstarts)):
+        for j in range(viewstarts[i], viewstops[i]):
+            pointers[numitems] = j
+            numitems += flags[k]
+            k += 1
+
+filter.scatter = _filter_scatter
+del _filter_scatter
+
+# same as scatter, but with flags indexed by position in the view, rather than in the order of the lists
+def _filter_select(viewstarts, viewstops, flags, pointers):
+    numitems = 0
+    for i in range(len(viewstarts)):
+        for j in range(viewstarts[i], viewstops[i]):
+            pointers[numitems] = j
+            numitems += flags[j]
+
+filter.select = _filter_select
+del _filter_select
+
+# pointers = innerpointers[pointers] without the temporary
+def _filter_chain(innerpointers, pointers):
+    for i in range(len(pointers)):
+        j = pointers[i]
+        if j < 0 or j >= len(innerpointers):
+            raise IndexError("pointer out of range")
+        pointers[i] = innerpointers[j]
+
+filter.chain = _filter_chain
+del _filter_chain
+
 transformations["filter"] = filter
 
 ################################################################ define
 
-def define(data, fieldname, fcn, args=(), at="", fieldtype=None, numba=True):
+def define(data, fieldname, fcn, args=(), at="", fieldtype=None, numba=True, cache=False):
     if not isinstance(args, tuple):
         try:
             args = tuple(args)
@@ -942,36 +1293,42 @@ def define(data, fieldname, fcn, args=(), at="", fieldtype=None, numba=True):
             else:
                 viewstarts, viewstops = listgenerator._getstartsstops(data._arrays, data._cache)
             viewschema = listgenerator.namedschema()
-            viewarrays = _DualSource(data._arrays, data._generator.namespaces())
+            viewarrays = _dualsource(data)
 
-            if not numpy.array_equal(viewstarts[1:], viewstops[:-1]):
+            if not _iscontiguous(viewstarts, viewstops):
                 raise NotImplementedError("'define' through a list defined by arrays that are not contiguous: view would require the creation of pointers")
 
             viewarrays.put(viewschema, viewstarts[:1], viewstops[-1:])   # unlike 'flatten', this does not preserve upper list structure (which is desirable here and not there)
-            view = viewschema(viewarrays)
+            view = _viewproxy(data, ("view", listgenerator.id), viewschema, viewarrays)
 
         else:
             recordnode = nodes[0]
             viewschema = oamap.schema.List(recordnode)
-            viewarrays = _DualSource(data._arrays, data._generator.namespaces())
+            viewarrays = _dualsource(data)
             offsets = numpy.array([0, 1], dtype=oamap.generator.ListGenerator.posdtype)
             viewarrays.put(viewschema, offsets[:1], offsets[-1:])
-            view = viewschema(viewarrays)
-
-        fcn = oamap.util.stringfcn(fcn)
-        params = fcn.__code__.co_varnames[:fcn.__code__.co_argcount]
-        avoid = set(params)
-        fcnname = oamap.util.varname(avoid, "fcn")
-        fillname = oamap.util.varname(avoid, "fill")
+            view = _viewproxy(data, ("view", at), viewschema, viewarrays)
 
         ptypes = oamap.util.paramtypes(args)
         if ptypes is not None:
             import numba as nb
             from oamap.compiler import typeof_generator
             ptypes = (typeof_generator(view._generator.content),) + ptypes
-        fcn = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba)
+
+        cache = _compilecache(fcn, numba, cache)
+        if ("fcn", ptypes) not in cache:
+            fcn = oamap.util.stringfcn(fcn)
+            code = fcn.__code__
+            cache["fcn", ptypes] = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba), code.co_varnames[:code.co_argcount]
+        fcn, params = cache["fcn", ptypes]
         rtype = oamap.util.returntype(fcn, ptypes)
 
+        avoid = set(params)
+        fcnname = oamap.util.varname(avoid, "fcn")
+        fillname = oamap.util.varname(avoid, "fill")
+        lenname = oamap.util.varname(avoid, "len")
+        prangename = oamap.util.varname(avoid, "prange")
+
         if fieldtype is None:
             if rtype is None or rtype == nb.types.pyobject:
                 fieldtype = oamap.schema.Primitive(numpy.float64, nullable=True)
@@ -985,26 +1342,27 @@ def define(data, fieldname, fcn, args=(), at="", fieldtype=None, numba=True):
         recordnode[fieldname] = fieldtype.deepcopy()
 
         if isinstance(fieldtype, oamap.schema.Primitive) and not fieldtype.nullable:
-            env = {fcnname: fcn}
-            oamap.util.doexec("""
+            if ("define", ptypes) not in cache:
+                env = {fcnname: fcn, lenname: len, prangename: oamap.util.tryprange(numba)}
+                oamap.util.doexec("""
 def {fill}({view}, {primitive}{params}):
-    {i} = 0
-    for {datum} in {view}:
-        {primitive}[{i}] = {fcn}({datum}{params})
-        {i} += 1
+    for {i} in {prange}({len}({view})):
+        {primitive}[{i}] = {fcn}({view}[{i}]{params})
 """.format(fill=fillname,
            view=oamap.util.varname(avoid, "view"),
            primitive=oamap.util.varname(avoid, "primitive"),
            params="".join("," + x for x in params[1:]),
            i=oamap.util.varname(avoid, "i"),
-           datum=oamap.util.varname(avoid, "datum"),
+           prange=prangename,
+           len=lenname,
            fcn=fcnname), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
+                cache["define", ptypes] = oamap.util.trycompile(env[fillname], numba=numba, parallel=True)
+            fill = cache["define", ptypes]
 
             primitive = numpy.empty(len(view), dtype=fieldtype.dtype)
             fill(*((view, primitive) + args))
 
-            arrays = _DualSource(data._arrays, data._generator.namespaces())
+            arrays = _dualsource(data)
             arrays.put(recordnode[fieldname], primitive)
             if isinstance(schema, oamap.schema.List):
                 return schema(arrays, numentries=len(data))
@@ -1012,39 +1370,37 @@ def {fill}({view}, {primitive}{params}):
                 return schema(arrays)
 
         elif isinstance(fieldtype, oamap.schema.Primitive):
-            env = {fcnname: fcn}
-            oamap.util.doexec("""
+            # each non-None value stays at its own index (mask[i] == i), so no running count is shared between iterations
+            if ("define-nullable", ptypes) not in cache:
+                env = {fcnname: fcn, lenname: len, prangename: oamap.util.tryprange(numba)}
+                oamap.util.doexec("""
 def {fill}({view}, {primitive}, {mask}{params}):
-    {i} = 0
-    {numitems} = 0
-    for {datum} in {view}:
-        {tmp} = {fcn}({datum}{params})
+    for {i} in {prange}({len}({view})):
+        {tmp} = {fcn}({view}[{i}]{params})
         if {tmp} is None:
             {mask}[{i}] = {maskedvalue}
         else:
-            {mask}[{i}] = {numitems}
-            {primitive}[{numitems}] = {tmp}
-            {numitems} += 1
-        {i} += 1
-    return {numitems}
+            {mask}[{i}] = {i}
+            {primitive}[{i}] = {tmp}
 """.format(fill=fillname,
            view=oamap.util.varname(avoid, "view"),
            primitive=oamap.util.varname(avoid, "primitive"),
            mask=oamap.util.varname(avoid, "mask"),
            params="".join("," + x for x in params[1:]),
            i=oamap.util.varname(avoid, "i"),
-           numitems=oamap.util.varname(avoid, "numitems"),
-           datum=oamap.util.varname(avoid, "datum"),
            tmp=oamap.util.varname(avoid, "tmp"),
+           prange=prangename,
+           len=lenname,
            fcn=fcnname,
            maskedvalue=oamap.generator.Masked.maskedvalue), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
+                cache["define-nullable", ptypes] = oamap.util.trycompile(env[fillname], numba=numba, parallel=True)
+            fill = cache["define-nullable", ptypes]
 
             primitive = numpy.empty(len(view), dtype=fieldtype.dtype)
             mask = numpy.empty(len(view), dtype=oamap.generator.Masked.maskdtype)
             fill(*((view, primitive, mask) + args))
 
-            arrays = _DualSource(data._arrays, data._generator.namespaces())
+            arrays = _dualsource(data)
             arrays.put(recordnode[fieldname], primitive, mask)
             if isinstance(schema, oamap.schema.List):
                 return schema(arrays, numentries=len(data))
@@ -1061,7 +1417,7 @@ transformations["define"] = define
 
 ################################################################ map
 
-def map(data, fcn, args=(), at="", names=None, numba=True):
+def map(data, fcn, args=(), at="", names=None, numba=True, cache=False):
     if not isinstance(args, tuple):
         try:
             args = tuple(args)
@@ -1079,39 +1435,52 @@ def map(data, fcn, args=(), at="", names=None, numba=True):
 
         viewstarts, viewstops = listgenerator._getstartsstops(data._arrays, data._cache)
         viewschema = listgenerator.namedschema()
-        viewarrays = _DualSource(data._arrays, data._generator.namespaces())
-        viewoffsets = numpy.array([viewstarts.min(), viewstops.max()], dtype=oamap.generator.ListGenerator.posdtype)
+        viewarrays = _dualsource(data)
+        viewoffsets = _viewoffsets(viewstarts, viewstops)
         viewarrays.put(viewschema, viewoffsets[:1], viewoffsets[-1:])
-        view = viewschema(viewarrays)
-
-        fcn = oamap.util.stringfcn(fcn)
-        params = fcn.__code__.co_varnames[:fcn.__code__.co_argcount]
-        avoid = set(params)
-        fcnname = oamap.util.varname(avoid, "fcn")
-        fillname = oamap.util.varname(avoid, "fill")
+        view = _viewproxy(data, ("view", listgenerator.id), viewschema, viewarrays)
 
         ptypes = oamap.util.paramtypes(args)
         if ptypes is not None:
             import numba as nb
             from oamap.compiler import typeof_generator
             ptypes = (typeof_generator(view._generator.content),) + ptypes
-        fcn = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba)
+
+        view = _primitiveview(view, listgenerator, data)
+        if isinstance(fcn, numpy.ufunc) and isinstance(view, numpy.ndarray):
+            return fcn(view, *args)
+
+        cache = _compilecache(fcn, numba, cache)
+        if ("fcn", ptypes) not in cache:
+            fcn = oamap.util.stringfcn(fcn)
+            code = fcn.__code__
+            cache["fcn", ptypes] = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba), code.co_varnames[:code.co_argcount]
+        fcn, params = cache["fcn", ptypes]
         rtype = oamap.util.returntype(fcn, ptypes)
 
+        avoid = set(params)
+        fcnname = oamap.util.varname(avoid, "fcn")
+        fillname = oamap.util.varname(avoid, "fill")
+        lenname = oamap.util.varname(avoid, "len")
+        prangename = oamap.util.varname(avoid, "prange")
+
         if rtype is None:
             viewindex = 0
+            first = None
             for datum in view:
                 first = fcn(*((datum,) + args))
                 viewindex += 1
                 if first is not None:
                     break
 
-            if viewindex == len(view):
+            if first is None:
                 out = None
 
             else:
+                rest = (x for x in (fcn(*((datum,) + args)) for datum in view[viewindex:]) if x is not None)
+
                 if isinstance(first, (numbers.Integral, numbers.Real, numpy.integer, numpy.floating, bool, numpy.bool_)):
-                    out = numpy.empty(len(view), dtype=numpy.float64)
+                    out = numpy.fromiter(itertools.chain((first,), rest), dtype=numpy.float64)
 
                 elif isinstance(first, tuple) and len(first) > 0 and all(isinstance(x, (numbers.Integral, numbers.Real, numpy.integer, numpy.floating, bool, numpy.bool_)) for x in first):
                     if names is None:
@@ -1122,57 +1491,44 @@ def map(data, fcn, args=(), at="", names=None, numba=True):
                     if len(names) != len(first):
                         raise TypeError("names has length {0} but function returns {1} numbers per row".format(len(names), len(first)))
 
-                    out = numpy.empty(len(view), dtype=list(zip(names, [numpy.float64] * len(first))))
+                    def rows():
+                        yield first
+                        for x in rest:
+                            if len(x) != len(first):
+                                raise TypeError("function must return tuples of numbers (rows of a table) with the same length in every row")
+                            yield x
 
-                else:
-                    print()
-                    print(isinstance(first, tuple))
-                    print(len(first))
-                    print([isinstance(x, (numbers.Integral, numbers.Real, numpy.integer, numpy.floating, bool, numpy.bool_)) for x in first])
+                    # all fields are float64, so a flat stream of numbers can be reinterpreted as rows without copying
+                    out = numpy.fromiter(itertools.chain.from_iterable(rows()), dtype=numpy.float64).view(list(zip(names, [numpy.float64] * len(first))))
 
+                else:
                     raise TypeError("function must return tuples of numbers (rows of a table)")
 
-                numitems = 0
-                out[numitems] = first
-                numitems += 1
-                if args == ():
-                    for datum in view[viewindex:]:
-                        tmp = fcn(datum)
-                        if tmp is not None:
-                            out[numitems] = tmp
-                            numitems += 1
-                else:
-                    for datum in view[viewindex:]:
-                        tmp = fcn(*((datum,) + args))
-                        if tmp is not None:
-                            out[numitems] = tmp
-                            numitems += 1
-
-                out = out[:numitems]
-                        
         elif isinstance(rtype, (nb.types.Integer, nb.types.Float, nb.types.Boolean)):
             out = numpy.empty(len(view), dtype=numpy.dtype(rtype.name))
-            env = {fcnname: fcn}
-            oamap.util.doexec("""
+            if ("map", ptypes) not in cache:
+                env = {fcnname: fcn, lenname: len, prangename: oamap.util.tryprange(numba)}
+                oamap.util.doexec("""
 def {fill}({view}, {out}{params}):
-    {numitems} = 0
-    for {datum} in {view}:
-        {out}[{numitems}] = {fcn}({datum}{params})
-        {numitems} += 1
+    for {i} in {prange}({len}({view})):
+        {out}[{i}] = {fcn}({view}[{i}]{params})
 """.format(fill=fillname,
            view=oamap.util.varname(avoid, "view"),
            out=oamap.util.varname(avoid, "out"),
            params="".join("," + x for x in params[1:]),
-           numitems=oamap.util.varname(avoid, "numitems"),
-           datum=oamap.util.varname(avoid, "datum"),
+           i=oamap.util.varname(avoid, "i"),
+           prange=prangename,
+           len=lenname,
            fcn=fcnname), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
+                cache["map", ptypes] = oamap.util.trycompile(env[fillname], numba=numba, parallel=True)
+            fill = cache["map", ptypes]
             fill(*((view, out) + args))
 
         elif isinstance(rtype, nb.types.Optional) and isinstance(rtype.type, (nb.types.Integer, nb.types.Float, nb.types.Boolean)):
             out = numpy.empty(len(view), dtype=numpy.dtype(rtype.type.name))
-            env = {fcnname: fcn}
-            oamap.util.doexec("""
+            if ("map-nullable", ptypes) not in cache:
+                env = {fcnname: fcn}
+                oamap.util.doexec("""
 def {fill}({view}, {out}{params}):
     {numitems} = 0
     for {datum} in {view}:
@@ -1189,7 +1545,8 @@ def {fill}({view}, {out}{params}):
            datum=oamap.util.varname(avoid, "datum"),
            tmp=oamap.util.varname(avoid, "tmp"),
            fcn=fcnname), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
+                cache["map-nullable", ptypes] = oamap.util.trycompile(env[fillname], numba=numba)
+            fill = cache["map-nullable", ptypes]
             numitems = fill(*((view, out) + args))
             out = out[:numitems]
 
@@ -1202,14 +1559,15 @@ def {fill}({view}, {out}{params}):
             if len(names) != len(rtype.types):
                 raise TypeError("names has length {0} but function returns {1} numbers per row".format(len(names), len(rtype.types)))
 
-            out = numpy.empty(len(view), dtype=list(zip(names, [numpy.dtype(x.name) for x in rtype.types])))
-            outs = tuple(out[n] for n in names)
+            # fill contiguous columns (which Numba can vectorize) and interleave them into rows once, at the end
+            outs = tuple(numpy.empty(len(view), dtype=numpy.dtype(x.name)) for x in rtype.types)
 
             outnames = [oamap.util.varname(avoid, "out" + str(i)) for i in range(len(names))]
             numitemsname = oamap.util.varname(avoid, "numitems")
             tmpname = oamap.util.varname(avoid, "tmp")
-            env = {fcnname: fcn}
-            oamap.util.doexec("""
+            if ("map-tuple", ptypes, len(outnames)) not in cache:
+                env = {fcnname: fcn}
+                oamap.util.doexec("""
 def {fill}({view}, {outs}{params}):
     {numitems} = 0
     for {datum} in {view}:
@@ -1225,9 +1583,14 @@ def {fill}({view}, {outs}{params}):
            tmp=tmpname,
            fcn=fcnname,
            assignments="\n        ".join("{out}[{numitems}] = {tmp}[{i}]".format(out=out, numitems=numitemsname, tmp=tmpname, i=i) for i, out in enumerate(outnames))), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
+                cache["map-tuple", ptypes, len(outnames)] = oamap.util.trycompile(env[fillname], numba=numba)
+            fill = cache["map-tuple", ptypes, len(outnames)]
             fill(*((view,) + outs + args))
 
+            out = numpy.empty(len(view), dtype=list(zip(names, [x.dtype for x in outs])))
+            for n, x in zip(names, outs):
+                out[n] = x
+
         elif isinstance(rtype, nb.types.Optional) and isinstance(rtype.type, (nb.types.Tuple, nb.types.NamedTuple, nb.types.UniTuple, nb.types.NamedUniTuple)) and len(rtype.type.types) > 0 and all(isinstance(x, (nb.types.Integer, nb.types.Float, nb.types.Boolean)) for x in rtype.type.types):
             if names is None:
                 if isinstance(rtype.type, (nb.types.NamedTuple, nb.types.NamedUniTuple)):
@@ -1237,15 +1600,15 @@ def {fill}({view}, {outs}{params}):
             if len(names) != len(rtype.type.types):
                 raise TypeError("names has length {0} but function returns {1} numbers per row".format(len(names), len(rtype.type.types)))
 
-            out = numpy.empty(len(view), dtype=list(zip(names, [numpy.dtype(x.name) for x in rtype.type.types])))
-            outs = tuple(out[n] for n in names)
+            outs = tuple(numpy.empty(len(view), dtype=numpy.dtype(x.name)) for x in rtype.type.types)
 
             outnames = [oamap.util.varname(avoid, "out" + str(i)) for i in range(len(names))]
             numitemsname = oamap.util.varname(avoid, "numitems")
             tmp2name = oamap.util.varname(avoid, "tmp2")
             requiredname = oamap.util.varname(avoid, "required")
-            env = {fcnname: fcn, requiredname: oamap.compiler.required}
-            oamap.util.doexec("""
+            if ("map-tuple-nullable", ptypes, len(outnames)) not in cache:
+                env = {fcnname: fcn, requiredname: oamap.compiler.required}
+                oamap.util.doexec("""
 def {fill}({view}, {outs}{params}):
     {numitems} = 0
     for {datum} in {view}:
@@ -1266,9 +1629,13 @@ def {fill}({view}, {outs}{params}):
            required=requiredname,
            fcn=fcnname,
            assignments="\n            ".join("{out}[{numitems}] = {tmp2}[{i}]".format(out=out, numitems=numitemsname, tmp2=tmp2name, i=i) for i, out in enumerate(outnames))), env)
-            fill = oamap.util.trycompile(env[fillname], numba=numba)
+                cache["map-tuple-nullable", ptypes, len(outnames)] = oamap.util.trycompile(env[fillname], numba=numba)
+            fill = cache["map-tuple-nullable", ptypes, len(outnames)]
             numitems = fill(*((view,) + outs + args))
-            out = out[:numitems]
+
+            out = numpy.empty(numitems, dtype=list(zip(names, [x.dtype for x in outs])))
+            for n, x in zip(names, outs):
+                out[n] = x[:numitems]
 
         else:
             raise TypeError("function must return tuples of numbers (rows of a table)")
@@ -1306,7 +1673,7 @@ actions["map"] = map
 
 ################################################################ reduce
 
-def reduce(data, tally, fcn, args=(), at="", numba=True):
+def reduce(data, tally, fcn, args=(), at="", numba=True, cache=False):
     if not isinstance(args, tuple):
         try:
             args = tuple(args)
@@ -1323,35 +1690,46 @@ def reduce(data, tally, fcn, args=(), at="", numba=True):
         listgenerator = data._generator.findbynames("List", listnode.namespace, starts=listnode.starts, stops=listnode.stops)
         viewstarts, viewstops = listgenerator._getstartsstops(data._arrays, data._cache)
         viewschema = listgenerator.namedschema()
-        viewarrays = _DualSource(data._arrays, data._generator.namespaces())
-        viewoffsets = numpy.array([viewstarts.min(), viewstops.max()], dtype=oamap.generator.ListGenerator.posdtype)
+        viewarrays = _dualsource(data)
+        viewoffsets = _viewoffsets(viewstarts, viewstops)
         viewarrays.put(viewschema, viewoffsets[:1], viewoffsets[-1:])
-        view = viewschema(viewarrays)
-
-        fcn = oamap.util.stringfcn(fcn)
-        if fcn.__code__.co_argcount < 2:
-            raise TypeError("function must have at least two parameters (data and tally)")
-
-        params = fcn.__code__.co_varnames[:fcn.__code__.co_argcount]
-        avoid = set(params)
-        fcnname = oamap.util.varname(avoid, "fcn")
-        fillname = oamap.util.varname(avoid, "fill")
-        tallyname = params[1]
+        view = _viewproxy(data, ("view", listgenerator.id), viewschema, viewarrays)
 
         ptypes = oamap.util.paramtypes(args)
         if ptypes is not None:
             import numba as nb
             from oamap.compiler import typeof_generator
             ptypes = (typeof_generator(view._generator.content), nb.typeof(tally)) + ptypes
-        fcn = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba)
+
+        view = _primitiveview(view, listgenerator, data)
+        if fcn in reduce.ufuncs and isinstance(view, numpy.ndarray) and len(args) == 0:
+            if len(view) == 0:
+                return tally
+            else:
+                return fcn(fcn.reduce(view), tally)
+
+        cache = _compilecache(fcn, numba, cache)
+        if ("fcn", ptypes) not in cache:
+            fcn = oamap.util.stringfcn(fcn)
+            code = fcn.__code__
+            if code.co_argcount < 2:
+                raise TypeError("function must have at least two parameters (data and tally)")
+            cache["fcn", ptypes] = oamap.util.trycompile(fcn, paramtypes=ptypes, numba=numba), code.co_varnames[:code.co_argcount]
+        fcn, params = cache["fcn", ptypes]
         rtype = oamap.util.returntype(fcn, ptypes)
 
+        avoid = set(params)
+        fcnname = oamap.util.varname(avoid, "fcn")
+        fillname = oamap.util.varname(avoid, "fill")
+        tallyname = params[1]
+
         if rtype is not None:
             if nb.typeof(tally) != rtype:
                 raise TypeError("function should return the same type as tally")
 
-        env = {fcnname: fcn}
-        oamap.util.doexec("""
+        if ("reduce", ptypes) not in cache:
+            env = {fcnname: fcn}
+            oamap.util.doexec("""
 def {fill}({view}, {tally}{params}):
     for {datum} in {view}:
         {tally} = {fcn}({datum}, {tally}{params})
@@ -1362,7 +1740,8 @@ def {fill}({view}, {tally}{params}):
            params="".join("," + x for x in params[2:]),
            datum=oamap.util.varname(avoid, "datum"),
            fcn=fcnname), env)
-        fill = oamap.util.trycompile(env[fillname], numba=numba)
+            cache["reduce", ptypes] = oamap.util.trycompile(env[fillname], numba=numba)
+        fill = cache["reduce", ptypes]
 
         return fill(*((view, tally) + args))
 
@@ -1396,4 +1775,7 @@ class ReduceCombiner(object):
 reduce.combiner = ReduceCombiner
 del ReduceCombiner
 
+# associative and commutative, so fcn(fcn.reduce(view), tally) is the same as folding item by item
+reduce.ufuncs = frozenset([numpy.add, numpy.multiply, numpy.maximum, numpy.minimum, numpy.fmax, numpy.fmin, numpy.logical_and, numpy.logical_or, numpy.logical_xor, numpy.bitwise_and, numpy.bitwise_or, numpy.bitwise_xor])
+
 actions["reduce"] = reduce
@@ -1388,6 +1388,18 @@ class Record(Schema):
     def items(self):
         return self._fields.items()
     
+    def _fieldname(self, field):
+        # reverse lookup from a field's Schema to its name; the id map is rebuilt whenever it misses or is stale
+        try:
+            name = self._fieldnames[id(field)]
+        except (AttributeError, KeyError):
+            pass
+        else:
+            if self._fields.get(name) is field:
+                return name
+        self._fieldnames = dict((id(x), n) for n, x in reversed(list(self._fields.items())))
+        return self._fieldnames.get(id(field))
+
     def _extend(self, fields, start):
         trial = []
         try:
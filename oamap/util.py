@@ -199,8 +199,11 @@ def python2hashable(value):
     return recurse(python2json(value))
 
 def varname(avoid, trial=None):
+    # count up from len(avoid), so a parameter that happens to be named "vN" can't stall the search
+    i = len(avoid)
     while trial is None or trial in avoid:
-        trial = "v" + str(len(avoid))
+        trial = "v" + str(i)
+        i += 1
     avoid.add(trial)
     return trial
 
@@ -258,7 +261,21 @@ def {fcn}({params}):
 
     return fcn
 
-def trycompile(fcn, paramtypes=None, numba=True):
+def tryprange(numba=True):
+    if numba is not None and numba is not False:
+        try:
+            import numba as nb
+        except ImportError:
+            pass
+        else:
+            return nb.prange
+
+    if sys.version_info[0] > 2:
+        return range
+    else:
+        return xrange
+
+def trycompile(fcn, paramtypes=None, numba=True, parallel=False):
     fcn = stringfcn(fcn)
 
     if numba is None or numba is False:
@@ -272,7 +289,10 @@ def trycompile(fcn, paramtypes=None, numba=True):
     if numba is True:
         numbaopts = {}
     else:
-        numbaopts = numba
+        numbaopts = dict(numba)
+
+    if parallel:
+        numbaopts.setdefault("parallel", True)
 
     if isinstance(fcn, nb.dispatcher.Dispatcher):
         fcn = fcn.py_fcn
@@ -32,12 +32,16 @@ import math
 from collections import namedtuple
 
 import unittest
+import sys
+
+import numpy
 
 try:
     import numba
 except ImportError:
     numba = None
 
+import oamap.generator
 from oamap.schema import *
 from oamap.operations import *
 
@@ -101,6 +105,9 @@ class TestOperations(unittest.TestCase):
 
         data = List(Record({"hey": List(Record({"one": "int"}))})).fromdata([{"hey": [{"one": 1}, {"one": 2}, {"one": 3}]}, {"hey": []}, {"hey": [{"one": 4}, {"one": 5}]}])
         self.assertEqual(project(data, "hey/one"), [[1, 2, 3], [], [4, 5]])
+        self.assertEqual(project(data, "hey/one"), [[1, 2, 3], [], [4, 5]])
+        self.assertTrue(project(data, "hey/one")._generator is project(data, "hey/one")._generator)
+        self.assertEqual(project(data[1:], "hey/one"), [[], [4, 5]])
 
     def test_keep(self):
         data = Record({"x1": "int", "x2": "float", "y1": List("bool")}).fromdata({"x1": 1, "x2": 2.2, "y1": [False, True]})
@@ -256,10 +263,12 @@ class TestOperations(unittest.TestCase):
         self.assertEqual(data[2].one, 3)
         data = tomask(data, "one", nan)
         self.assertEqual(data[0].one, None)
-        data = tomask(data, "one", 2)
-        self.assertEqual(data[1].one, None)
-        data = tomask(data, "one", 2, 3)
+        data2 = tomask(data, "one", 2)
+        self.assertEqual(data2[1].one, None)
+        self.assertEqual(data[1].one, 2)
+        data = tomask(data2, "one", 2, 3)
         self.assertEqual(data[2].one, None)
+        self.assertEqual(data2[2].one, 3)
 
         data = List(Record({"hey": Record({"one": "float"})})).fromdata([{"hey": {"one": nan}}, {"hey": {"one": 2}}, {"hey": {"one": 3}}])
         self.assertTrue(math.isnan(data[0].hey.one))
@@ -282,7 +291,62 @@ class TestOperations(unittest.TestCase):
         self.assertEqual(data[0].hey[1].one, None)
         data = tomask(data, "hey/one", 2, 3)
         self.assertEqual(data[0].hey[2].one, None)
-        
+
+        data = List(Record({"one": Primitive("float", nullable=True)})).fromdata([{"one": None}, {"one": 2}, {"one": nan}, {"one": 3}])
+        data = tomask(data, "one", 3)
+        self.assertEqual([x.one for x in data][:2], [None, 2])
+        self.assertTrue(math.isnan(data[2].one))
+        self.assertEqual(data[3].one, None)
+        data = tomask(data, "one", 1, 2)
+        self.assertEqual(data[1].one, None)
+        self.assertTrue(math.isnan(data[2].one))
+
+    def test_tomask_compiled(self):
+        if numba is None:
+            sys.stderr.write("Numba is not installed: skipping ... ")
+        else:
+            import oamap.operations
+            nan = float("nan")
+            primitive = numpy.array([nan, 2, 3, 4], dtype=numpy.float64)
+            oldmask = numpy.array([0, -1, 2, 3], dtype=oamap.generator.Masked.maskdtype)
+            for identity in (True, False):
+                expected = [0, -1, 2, 3] if not identity else [0, 1, 2, 3]
+
+                mask = numpy.empty(4, dtype=oamap.generator.Masked.maskdtype)
+                oamap.operations._kernel(tomask, "isnan", parallel=True)(primitive, oldmask, mask, identity)
+                self.assertEqual(mask.tolist(), [-1] + expected[1:])
+
+                mask = numpy.empty(4, dtype=oamap.generator.Masked.maskdtype)
+                oamap.operations._kernel(tomask, "equal", parallel=True)(primitive, oldmask, mask, identity, 3.0)
+                self.assertEqual(mask.tolist(), expected[:2] + [-1, 3])
+
+                mask = numpy.empty(4, dtype=oamap.generator.Masked.maskdtype)
+                oamap.operations._kernel(tomask, "inrange", parallel=True)(primitive, oldmask, mask, identity, 2.0, 3.0)
+                self.assertEqual(mask.tolist(), [0, -1, -1, 3])
+
+            self.assertTrue(isinstance(tomask.isnan, numba.dispatcher.Dispatcher))
+            self.assertTrue(isinstance(tomask.equal, numba.dispatcher.Dispatcher))
+            self.assertTrue(isinstance(tomask.inrange, numba.dispatcher.Dispatcher))
+
+    def test_tomask_vectorized(self):
+        nan = float("nan")
+        primitive = numpy.array([nan, 2, 3, 4], dtype=numpy.float64)
+        oldmask = numpy.array([0, -1, 2, 3], dtype=oamap.generator.Masked.maskdtype)
+        for identity in (True, False):
+            expected = [0, -1, 2, 3] if not identity else [0, 1, 2, 3]
+
+            mask = numpy.empty(4, dtype=oamap.generator.Masked.maskdtype)
+            tomask.vectorized(primitive, oldmask, mask, identity, "isnan", ())
+            self.assertEqual(mask.tolist(), [-1] + expected[1:])
+
+            mask = numpy.empty(4, dtype=oamap.generator.Masked.maskdtype)
+            tomask.vectorized(primitive, oldmask, mask, identity, "equal", (3.0,))
+            self.assertEqual(mask.tolist(), expected[:2] + [-1, 3])
+
+            mask = numpy.empty(4, dtype=oamap.generator.Masked.maskdtype)
+            tomask.vectorized(primitive, oldmask, mask, identity, "inrange", (2.0, 3.0))
+            self.assertEqual(mask.tolist(), [0, -1, -1, 3])
+
     def test_flatten(self):
         data = List(List("int")).fromdata([[1, 2, 3], [], [4, 5]])
         self.assertEqual(flatten(data), [1, 2, 3, 4, 5])
@@ -303,6 +367,10 @@ class TestOperations(unittest.TestCase):
         self.assertEqual(filter(data, fcn, 0, numba={"nopython": True}), [2, 4])
         self.assertEqual(filter(data, fcn, 1, numba=False), [1, 3, 5])
         self.assertEqual(filter(data, fcn, 1, numba={"nopython": True}), [1, 3, 5])
+        self.assertEqual(filter(List("float").fromdata([1, float("nan"), 3]), numpy.isfinite), [1, 3])
+        self.assertRaises(TypeError, lambda: filter(List("float").fromdata([1, 2, 3]), numpy.sqrt))
+        self.assertEqual(filter(data, lambda x, fcn, v3: x > fcn + v3, (1, 1), numba=False), [3, 4, 5])
+        self.assertEqual(filter(data, lambda x, fcn, v3: x > fcn + v3, (1, 1), numba={"nopython": True}), [3, 4, 5])
 
         data = List("int").fromdata([1, 2, 3, 4, 5])
         self.assertEqual(filter(filter(data, lambda x: x > 1, numba=False), lambda x: x < 5, numba=False), [2, 3, 4])
@@ -331,6 +399,10 @@ class TestOperations(unittest.TestCase):
         self.assertEqual(len(filter(data, lambda obj: obj.x % 2 == 0, at="hey", numba=False).hey), 2)
         self.assertEqual(len(filter(data, lambda obj: obj.x % 2 == 0, at="hey", numba={"nopython": True}).hey), 2)
 
+        data = List(Record({"x": List("float")})).fromdata([{"x": [1, float("nan")]}, {"x": []}, {"x": [float("nan"), 3, 4]}])
+        self.assertEqual([obj.x for obj in filter(data, numpy.isfinite, at="x")], [[1], [], [3, 4]])
+        self.assertRaises(TypeError, lambda: filter(data, numpy.sqrt, at="x"))
+
     def test_define(self):
         data = Record({"x": "int"}).fromdata({"x": 5})
         fcn = lambda obj, y: obj.x + y
@@ -368,8 +440,29 @@ class TestOperations(unittest.TestCase):
         self.assertEqual([obj.z for obj in new[1].hey], [11, None, 13])
         new = define(data, "z", lambda obj: None if obj.x % 2 == 0 else obj.x + 10, at="hey", numba={"nopython": True})
         self.assertEqual([obj.z for obj in new[1].hey], [11, None, 13])
-        
+
+        def adder(y):
+            return lambda obj: obj.x + y
+        fcns = [adder(10), adder(20)]
+        first = define(data, "z", fcns[0], at="hey", numba={"nopython": True})
+        self.assertEqual([obj.z for obj in first[1].hey], [11, 12, 13])
+        self.assertEqual([obj.z for obj in define(first, "w", fcns[0], at="hey", numba={"nopython": True})[1].hey], [11, 12, 13])
+        self.assertEqual([obj.z for obj in define(data, "z", fcns[1], at="hey", numba={"nopython": True})[1].hey], [21, 22, 23])
+        self.assertEqual([obj.z for obj in define(data, "z", "obj.x + 10", at="hey", numba=False)[1].hey], [11, 12, 13])
+        self.assertEqual([obj.z for obj in define(data, "z", "obj.x + 10", at="hey", numba=False)[1].hey], [11, 12, 13])
+
+        second = define(first, "w", lambda obj: obj.z * 2, at="hey", numba=False)
+        third = define(first, "w", lambda obj: obj.z * 3, at="hey", numba=False)
+        self.assertEqual([(obj.z, obj.w) for obj in second[1].hey], [(11, 22), (12, 24), (13, 26)])
+        self.assertEqual([(obj.z, obj.w) for obj in third[1].hey], [(11, 33), (12, 36), (13, 39)])
+        self.assertEqual(set(first._generator.namedschema().content["hey"].content.keys()), set(["x", "z"]))
+
     def test_map(self):
+        data = List("float").fromdata([1, 4, 9])
+        self.assertEqual(map(data, numpy.sqrt).tolist(), [1, 2, 3])
+        self.assertEqual(map(data, lambda x: x + 1, numba=False).tolist(), [2, 5, 10])
+        self.assertEqual(map(data, lambda x: x + 1, numba={"nopython": True}).tolist(), [2, 5, 10])
+
         data = List(Record({"x": "int"})).fromdata([{"x": 1}, {"x": 2}, {"x": 3}])
         fcn = lambda obj, y: obj.x + y
         new = map(data, fcn, 10, numba=False)
@@ -392,6 +485,8 @@ class TestOperations(unittest.TestCase):
             self.assertEqual(new.dtype, numpy.dtype(numpy.float64))
         else:
             self.assertEqual(new.dtype, numpy.dtype(numpy.int64))
+        self.assertEqual(map(data, lambda obj: None if obj.x < 3 else obj.x, numba=False).tolist(), [3])
+        self.assertEqual(map(data, lambda obj: None, numba=False), None)
 
         data = Record({"hey": List(Record({"x": "int", "y": "float"}))}).fromdata({"hey": [{"x": 1, "y": 1.1}, {"x": 2, "y": 2.2}, {"x": 3, "y": 3.3}]})
         new = map(data, lambda obj: (obj.x, obj.y, obj.x + obj.y), at="hey", numba=False)
@@ -485,6 +580,9 @@ class TestOperations(unittest.TestCase):
         self.assertEqual(reduce(data, 0, fcn, 1, numba=False), 20)
         self.assertEqual(reduce(data, 0, fcn, 0, numba={"nopython": True}), 15)
         self.assertEqual(reduce(data, 0, fcn, 1, numba={"nopython": True}), 20)
+        self.assertEqual(reduce(data, 0, numpy.add), 15)
+        self.assertEqual(reduce(data, 0, numpy.maximum), 5)
+        self.assertEqual(reduce(List("int").fromdata([]), 3, numpy.add), 3)
 
         data = List(Record({"x": "int"})).fromdata([{"x": 1}, {"x": 2}, {"x": 3}, {"x": 4}, {"x": 5}])
         self.assertEqual(reduce(data, 0, lambda obj, tally: obj.x + tally, numba=False), 15)
@@ -497,3 +595,37 @@ class TestOperations(unittest.TestCase):
         data = List(Record({"hey": List(Record({"x": "int"}))})).fromdata([{"hey": [{"x": 1}, {"x": 2}, {"x": 3}]}, {"hey": []}, {"hey": [{"x": 4}, {"x": 5}]}])
         self.assertEqual(reduce(data, 0, lambda obj, tally: obj.x + tally, at="hey", numba=False), 15)
         self.assertEqual(reduce(data, 0, lambda obj, tally: obj.x + tally, at="hey", numba={"nopython": True}), 15)
+
+    def test_compilecache(self):
+        if numba is None:
+            sys.stderr.write("Numba is not installed: skipping ... ")
+        else:
+            data = List(Record({"x": "float"})).fromdata([{"x": 1}, {"x": 2}, {"x": 3}])
+            cut = numpy.array([1.0])
+            fcn = lambda obj: obj.x + cut[0]
+            tallyfcn = lambda obj, tally: obj.x + tally + cut[0]
+
+            # by default, every call compiles, so the function sees the current state of what it reads
+            self.assertEqual(list(map(data, fcn)), [2.0, 3.0, 4.0])
+            cut[0] = 100
+            self.assertEqual(list(map(data, fcn)), [101.0, 102.0, 103.0])
+
+            # with cache=True, the first compilation is reused, along with the values Numba froze into it
+            cut[0] = 1
+            for i in range(3):
+                self.assertEqual(list(map(data, fcn, cache=True)), [2.0, 3.0, 4.0])
+                self.assertEqual(reduce(data, 0.0, tallyfcn, cache=True), 9.0)
+            cut[0] = 100
+            self.assertEqual(list(map(data, fcn, cache=True)), [2.0, 3.0, 4.0])
+            self.assertEqual(list(map(data, fcn)), [101.0, 102.0, 103.0])
+
+            nested = List(List(Record({"x": "int"}))).fromdata([[{"x": 1}], [], [{"x": 2}, {"x": 3}]])
+            record = Record({"hey": List(Record({"x": "int"}))}).fromdata({"hey": [{"x": 1}, {"x": 2}, {"x": 3}]})
+            definefcn = lambda obj: obj.x * 2
+            filterfcn = lambda obj: obj.x > 1
+            for i in range(3):
+                self.assertEqual([[obj.y for obj in x] for x in define(nested, "y", definefcn, cache=True)], [[2], [], [4, 6]])
+                self.assertEqual([obj.x for obj in filter(record, filterfcn, at="hey", cache=True).hey], [2, 3])
+
+            # options that can't be hashed are compiled without the cache
+            self.assertEqual(list(map(data, lambda obj: obj.x * 2, numba={"nopython": True, "locals": {}}, cache=True)), [2.0, 4.0, 6.0])